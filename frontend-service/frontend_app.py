@@ -1,72 +1,76 @@
-import requests
-from nicegui import ui
+import asyncio
+import functools
+import httpx
+import os
+import time
+from nicegui import app, background_tasks, ui
 from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
 
 # API Endpoints
 API_URL_USER = "http://user-service:5001"
 API_URL_TODO = "http://todo-service:5002"
 
-# Global variables to track current user and todos
-current_user = None
-todos = []
-
-# Define a container for the main content (login screen or todo list)
-main_container = ui.column()
-
-# Unified CSS for all screens with standardized button widths
-ui.add_head_html("""
-    <style>
-        .grid-row {
-            display: grid;
-            grid-template-columns: 1fr 2fr 1fr;  /* Three-column layout for all screens */
-            align-items: center;  /* Align items in the center for consistency */
-            gap: 10px;
-            margin-bottom: 16px;
-        }
-
-        .card {
-            padding: 20px;
-            background-color: #f5f5f5;
-            border-radius: 8px;
-            box-shadow: 0 2px 4px rgba(0, 0, 0, 0.1);
-            margin-bottom: 20px;
-        }
-
-        .text-xl {
-            font-size: 1.5rem;
-            font-weight: bold;
-        }
-
-        .input-field {
-            width: 100%;  /* Full width input for consistency */
-        }
-
-        .timestamp-label {
-            width: 150px;  /* Consistent width for the timestamp column */
-        }
-
-        .description-label {
-            width: 400px;  /* Consistent width for todo description */
-        }
-
-        .action-buttons {
-            display: flex;
-            justify-content: flex-start;
-            gap: 10px;  /* Space between action buttons */
-        }
-
-        .button {
-            padding: 5px 10px;  /* Standardized button size */
-            font-size: 0.875rem;
-            height: auto;  /* Make the buttons compact */
-            flex: 0 1 auto;  /* Dynamic button width */
-        }
-
-        .logout-container {
-            margin-top: 20px;
-        }
-    </style>
-""")
+# HTTP client sessions, one per service so each host keeps its own connection pool.
+# The services speak HTTP/2 without TLS, so the clients use it from the first request
+# (http1=False) and multiplex concurrent calls over a single connection.
+# They are created on startup so they are opened and closed with the running event loop.
+session_user = None
+session_todo = None
+
+
+def create_client():
+    """
+    Creates an HTTP/2 client for one of the backend services.
+
+    Returns:
+        httpx.AsyncClient: A client that keeps its connections open between calls.
+    """
+    return httpx.AsyncClient(http1=False, http2=True, limits=httpx.Limits(max_connections=16))
+
+
+async def create_sessions():
+    """
+    Creates the HTTP client sessions used to talk to the backend services.
+    """
+    global session_user, session_todo
+    session_user = create_client()
+    session_todo = create_client()
+
+
+async def close_sessions():
+    """
+    Closes the HTTP client sessions when the application shuts down.
+    """
+    await session_user.aclose()
+    await session_todo.aclose()
+
+
+app.on_startup(create_sessions)
+app.on_shutdown(close_sessions)
+
+# The logged-in user is kept per browser in app.storage.user ('id' and 'username'),
+# and each client's UI elements in app.storage.client, so concurrent users stay apart.
+# NiceGUI signs the browser session cookie with this secret, so it has no default.
+STORAGE_SECRET = os.environ.get('STORAGE_SECRET')
+if not STORAGE_SECRET:
+    raise RuntimeError('STORAGE_SECRET must be set to a secret for signing browser sessions')
+
+# Client-side cache of todo lists keyed by user ID: {user_id: (fetched_at, todos)}
+TODO_CACHE_TTL = 5.0  # Seconds a cached todo list is served without asking the API
+_todo_cache = {}
+
+# Todo writes queued for the next batch request, as (operation, future) pairs
+BATCH_WINDOW = 0.1  # Seconds to collect operations before sending them together
+pending_ops = []
+_flush_handle = None
+
+# Unified CSS for all screens, served as a static file so browsers can cache it
+STATIC_DIR = Path(__file__).parent / 'static'
+STATIC_MAX_AGE = 86400  # Seconds browsers may reuse static files without revalidating
+
+app.add_static_files('/static', STATIC_DIR, max_cache_age=STATIC_MAX_AGE)
 
 
 # Helper Functions
@@ -82,38 +86,158 @@ def notify_action(message, color='green'):
     ui.notify(message, color=color)
 
 
+async def get_todos(uid):
+    """
+    Returns the todos for a user, served from the local cache while it is fresh.
+
+    Args:
+        uid (int): The ID of the user whose todos to fetch.
+
+    Returns:
+        list: The user's todos, or None if the API request failed.
+    """
+    cached = _todo_cache.get(uid)
+    if cached and time.monotonic() - cached[0] < TODO_CACHE_TTL:
+        return cached[1]
+
+    try:
+        response = await session_todo.get(f"{API_URL_TODO}/todos", params={"user_id": uid})
+    except httpx.HTTPError:
+        return None
+    if response.status_code != 200:
+        return None
+    user_todos = response.json()
+    _todo_cache[uid] = (time.monotonic(), user_todos)
+    return user_todos
+
+
+def patch_cached_todos(uid, todo_id, todo=None):
+    """
+    Applies a successful write to the cached todo list so the next refresh needs no request.
+
+    Args:
+        uid (int): The ID of the user who owns the todo.
+        todo_id (int): The ID of the todo that was written.
+        todo (dict): The new todo or its changed fields, or None if the todo was deleted.
+    """
+    cached = _todo_cache.get(uid)
+    if not cached:
+        return
+
+    user_todos = cached[1]
+    for index, cached_todo in enumerate(user_todos):
+        if cached_todo['id'] == todo_id:
+            if todo is None:
+                del user_todos[index]
+            else:
+                cached_todo.update(todo)
+            return
+    if todo is not None and 'created_at' in todo:
+        user_todos.append(todo)  # A newly added todo
+    elif todo is not None:
+        del _todo_cache[uid]  # An edit of a todo we never saw, so fetch the list again
+
+
+def queue_todo_op(op):
+    """
+    Queues a todo operation for the next batch request to the todo service.
+
+    Args:
+        op (dict): The operation, as accepted by the /todos/batch endpoint.
+
+    Returns:
+        asyncio.Future: Resolves to the operation's result once the batch has been sent.
+    """
+    global _flush_handle
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    pending_ops.append((op, future))
+    if _flush_handle is None:
+        _flush_handle = loop.call_later(BATCH_WINDOW, flush_todo_ops)
+    return future
+
+
+def flush_todo_ops():
+    """
+    Sends all queued todo operations in a single batch request.
+    """
+    global pending_ops, _flush_handle
+    ops, pending_ops = pending_ops, []
+    _flush_handle = None
+    background_tasks.create(send_todo_ops(ops), name='send_todo_ops')
+
+
+async def send_todo_ops(ops):
+    """
+    Posts a batch of todo operations and resolves each operation's future with its result.
+
+    Args:
+        ops (list): The (operation, future) pairs to send.
+    """
+    try:
+        response = await session_todo.post(f"{API_URL_TODO}/todos/batch", json={"ops": [op for op, _ in ops]})
+        if response.status_code == 200:
+            results = response.json()
+        else:
+            results = [{'status': response.status_code}] * len(ops)
+    except httpx.HTTPError:
+        # The todo service could not be reached, so every operation fails like a 503
+        results = [{'status': 503}] * len(ops)
+    except Exception as error:
+        for _, future in ops:
+            if not future.done():  # The waiting handler may have been cancelled
+                future.set_exception(error)
+        return
+
+    for (_, future), result in zip(ops, results):
+        if not future.done():
+            future.set_result(result)
+
+
 # User Management Functions
 
-def login(username, password):
+async def login(username, password):
     """
-    Logs in a user with the given username and password.
+    Logs in a user with the given username and password. The user service returns
+    the user's todos along with the login, so the todo screen is shown without a
+    separate request to the todo service. If it could not fetch them, they are
+    loaded from the todo service directly.
 
     Args:
         username (str): The user's username.
         password (str): The user's password.
     """
-    global current_user
-    response = requests.post(f"{API_URL_USER}/login", json={"username": username, "password": password})
-    if response.status_code == 200:
-        current_user = response.json()
-        notify_action('Login successful!', color='green')
-        load_todos()
-    else:
+    try:
+        response = await session_user.post(f"{API_URL_USER}/login_with_todos", json={"username": username, "password": password})
+    except httpx.HTTPError:
+        notify_action('Login failed!', color='red')
+        return
+    if response.status_code != 200:
         notify_action('Login failed!', color='red')
+        return
+    data = response.json()
+    app.storage.user.update(data['user'])
+    notify_action('Login successful!', color='green')
+    if data['todos'] is None:
+        await load_todos()
+        return
+    _todo_cache[data['user']['id']] = (time.monotonic(), data['todos'])
+    show_todo_screen(data['todos'])
 
 
 def logout():
     """
     Logs out the current user and resets the application state.
     """
-    global current_user, todos
-    current_user = None
-    todos = []
+    uid = app.storage.user.get('id')
+    if uid:
+        _todo_cache.pop(uid, None)
+    app.storage.user.clear()
     show_login_screen()
     notify_action('Logged out successfully!', color='blue')
 
 
-def create_account(username, password):
+async def create_account(username, password):
     """
     Creates a new user account.
 
@@ -121,61 +245,110 @@ def create_account(username, password):
         username (str): The new user's username.
         password (str): The new user's password.
     """
-    response = requests.post(f"{API_URL_USER}/create", json={"username": username, "password": password})
+    try:
+        response = await session_user.post(f"{API_URL_USER}/create", json={"username": username, "password": password})
+    except httpx.HTTPError:
+        notify_action('Failed to create account.', color='red')
+        return
     if response.status_code == 201:
         notify_action('Account created successfully!', color='green')
     else:
         notify_action('Failed to create account.', color='red')
 
 
+def submit_login(form):
+    """
+    Logs in with the values entered on the login screen.
+
+    Args:
+        form (SimpleNamespace): The login screen's username and password inputs.
+    """
+    return login(form.username.value, form.password.value)
+
+
+def submit_create_account(form):
+    """
+    Creates an account with the values entered on the login screen.
+
+    Args:
+        form (SimpleNamespace): The login screen's username and password inputs.
+    """
+    return create_account(form.username.value, form.password.value)
+
+
 # Todo Management Functions
 
-def load_todos():
+async def load_todos():
     """
     Loads the todos for the current user from the API.
     """
-    global todos
-    if current_user:
-        response = requests.get(f"{API_URL_TODO}/todos", params={"user_id": current_user['id']})
-        if response.status_code == 200:
-            todos = response.json()
-            show_todo_screen()
-        else:
+    uid = app.storage.user.get('id')
+    if uid:
+        user_todos = await get_todos(uid)
+        if user_todos is None:
             notify_action('Failed to load todos!', color='red')
+            return
+        if app.storage.client['todo_list_container'] is None:
+            show_todo_screen(user_todos)
+        else:
+            refresh_todo_list(user_todos)
 
 
-def add_todo(description):
+async def add_todo(description):
     """
     Adds a new todo for the current user.
 
     Args:
         description (str): The description of the new todo.
+
+    Returns:
+        bool: True if the todo was added.
     """
-    if current_user:
-        response = requests.post(f"{API_URL_TODO}/todos", json={"description": description, "user_id": current_user['id']})
-        if response.status_code == 201:
-            notify_action('Todo added!', color='green')
-            load_todos()
-        else:
+    uid = app.storage.user.get('id')
+    if uid:
+        result = await queue_todo_op({"op": "add", "description": description, "user_id": uid})
+        if result['status'] != 201:
             notify_action('Failed to add todo!', color='red')
+            return False
+        patch_cached_todos(uid, result['todo']['id'], result['todo'])
+        notify_action('Todo added!', color='green')
+        await load_todos()
+        return True
+    return False
 
 
-def delete_todo(todo_id):
+async def submit_new_todo(description_input):
+    """
+    Adds the todo entered on the todo screen and clears the input once it was added,
+    so clicking ADD again does not add it twice.
+
+    Args:
+        description_input (ui.input): The "Add a new todo..." input.
+    """
+    description = description_input.value
+    if await add_todo(description) and description_input.value == description:
+        description_input.value = ''
+
+
+async def delete_todo(todo_id):
     """
     Deletes a todo for the current user.
 
     Args:
         todo_id (int): The ID of the todo to delete.
     """
-    response = requests.delete(f"{API_URL_TODO}/todos/{todo_id}")
-    if response.status_code == 200:
-        notify_action('Todo deleted!', color='green')
-        load_todos()
-    else:
+    uid = app.storage.user.get('id')
+    result = await queue_todo_op({"op": "delete", "id": todo_id})
+    if result['status'] != 200:
         notify_action('Failed to delete todo!', color='red')
+        return
+    if uid:
+        patch_cached_todos(uid, todo_id)
+    notify_action('Todo deleted!', color='green')
+    await load_todos()
 
 
-def edit_todo(todo_id, new_description):
+async def edit_todo(todo_id, new_description):
     """
     Edits an existing todo's description.
 
@@ -183,21 +356,40 @@ def edit_todo(todo_id, new_description):
         todo_id (int): The ID of the todo to edit.
         new_description (str): The new description for the todo.
     """
-    response = requests.put(f"{API_URL_TODO}/todos/{todo_id}", json={"description": new_description})
-    if response.status_code == 200:
-        notify_action('Todo edited!', color='green')
-        load_todos()
-    else:
+    uid = app.storage.user.get('id')
+    result = await queue_todo_op({"op": "edit", "id": todo_id, "description": new_description})
+    if result['status'] != 200:
         notify_action('Failed to edit todo!', color='red')
+        return
+    if uid:
+        patch_cached_todos(uid, todo_id, result['todo'])
+    notify_action('Todo edited!', color='green')
+    await load_todos()
 
 
 # UI Rendering Functions
 
+def clear_main_container():
+    """
+    Clears the client's main content and forgets the rows of the todo list it contained.
+
+    Returns:
+        ui.column: The cleared main container.
+    """
+    client_storage = app.storage.client
+    main_container = client_storage['main_container']
+    main_container.clear()
+    client_storage['todo_list_container'] = None
+    client_storage['todo_widgets'] = {}
+    return main_container
+
+
 def show_login_screen():
     """
     Displays the login screen where users can log in or create an account.
     """
-    main_container.clear()
+    main_container = clear_main_container()
+    form = SimpleNamespace()
 
     with main_container:
         with ui.card().classes('card'):
@@ -206,59 +398,94 @@ def show_login_screen():
             # Username Input
             with ui.element('div').classes('grid-row'):
                 ui.label('').classes('timestamp-label')  # Empty first column for alignment
-                username = ui.input(label='Username').classes('input-field description-label')
-                ui.button('Create Account', on_click=lambda: create_account(username.value, password.value)).classes('button')
+                form.username = ui.input(label='Username').classes('input-field description-label')
+                ui.button('Create Account', on_click=functools.partial(submit_create_account, form)).classes('button')
 
             # Password Input
             with ui.element('div').classes('grid-row'):
                 ui.label('').classes('timestamp-label')  # Empty first column for alignment
-                password = ui.input(label='Password', password=True).classes('input-field description-label')
-                ui.button('Login', on_click=lambda: login(username.value, password.value)).classes('button')
+                form.password = ui.input(label='Password', password=True).classes('input-field description-label')
+                ui.button('Login', on_click=functools.partial(submit_login, form)).classes('button')
 
 
-def show_todo_screen():
+def show_todo_screen(todos):
     """
     Displays the todo list screen for the current user.
+
+    Args:
+        todos (list): The todo items to show.
     """
-    main_container.clear()
+    main_container = clear_main_container()
 
-    username = current_user['username'] if current_user else 'Your'
+    username = app.storage.user.get('username', 'Your')
 
     with main_container:
         with ui.card().classes('card'):
             ui.label(f"{username}'s Todo List").classes('text-xl mb-4')
 
-            if todos:
-                for todo in todos:
-                    render_todo(todo)
+            app.storage.client['todo_list_container'] = ui.element('div')
+            refresh_todo_list(todos)
 
             # Add New Todo Section
             with ui.element('div').classes('grid-row'):
                 ui.label('').classes('timestamp-label')  # Empty column for timestamp
                 new_todo_description = ui.input(placeholder='Add a new todo...').classes('input-field description-label')
                 with ui.row().classes('action-buttons'):
-                    ui.button('ADD', on_click=lambda: add_todo(new_todo_description.value)).classes('button')
+                    ui.button('ADD', on_click=functools.partial(submit_new_todo, new_todo_description)).classes('button')
 
         # Logout Button
         with ui.row().classes('logout-container'):
             ui.button('Logout', on_click=logout).classes('button')
 
 
+def refresh_todo_list(todos):
+    """
+    Brings the rendered todo list in line with the given todos. Rows are only
+    created for new todos, deleted for removed ones and relabeled for edited ones.
+
+    Args:
+        todos (list): The todo items that should be shown.
+    """
+    todo_list_container = app.storage.client['todo_list_container']
+    todo_widgets = app.storage.client['todo_widgets']
+    current_todos = {todo['id']: todo for todo in todos}
+
+    for todo_id in list(todo_widgets):
+        if todo_id not in current_todos:
+            row, _, _ = todo_widgets.pop(todo_id)
+            row.delete()
+
+    with todo_list_container:
+        for todo_id, todo in current_todos.items():
+            if todo_id not in todo_widgets:
+                todo_widgets[todo_id] = render_todo(todo)
+                continue
+
+            _, description_label, rendered_todo = todo_widgets[todo_id]
+            if description_label.text != todo['description']:
+                description_label.text = todo['description']
+            rendered_todo.update(todo)
+
+
 def render_todo(todo):
     """
     Renders an individual todo item with Edit and Delete buttons.
 
     Args:
         todo (dict): The todo item to render.
+
+    Returns:
+        tuple: The row element, its description label and the rendered todo.
     """
     todo_id = todo['id']
 
-    with ui.element('div').classes('grid-row'):
+    with ui.element('div').classes('grid-row') as row:
         ui.label(todo['created_at']).classes('timestamp-label')
-        ui.label(todo['description']).classes('input-field description-label')
+        description_label = ui.label(todo['description']).classes('input-field description-label')
         with ui.row().classes('action-buttons'):
-            ui.button('Edit', on_click=lambda: start_edit(todo)).classes('button')
-            ui.button('Delete', on_click=lambda: delete_todo(todo_id)).classes('button')
+            ui.button('Edit', on_click=functools.partial(start_edit, todo)).classes('button')
+            ui.button('Delete', on_click=functools.partial(delete_todo, todo_id)).classes('button')
+    return row, description_label, todo
 
 
 def show_edit_screen(todo):
@@ -268,7 +495,7 @@ def show_edit_screen(todo):
     Args:
         todo (dict): The todo item to edit.
     """
-    main_container.clear()
+    main_container = clear_main_container()
 
     with main_container:
         with ui.card().classes('card'):
@@ -277,7 +504,7 @@ def show_edit_screen(todo):
                 new_description = ui.input(value=todo['description']).classes('input-field description-label')
                 with ui.row().classes('action-buttons'):
                     ui.button('Save', on_click=lambda: edit_todo(todo['id'], new_description.value)).classes('button')
-                    ui.button('Cancel', on_click=lambda: [show_todo_screen(), notify_action('Edit canceled', color='blue')]).classes('button')
+                    ui.button('Cancel', on_click=cancel_edit).classes('button')
 
 
 def start_edit(todo):
@@ -290,8 +517,29 @@ def start_edit(todo):
     show_edit_screen(todo)
 
 
+async def cancel_edit():
+    """
+    Cancels editing and returns to the todo list screen.
+    """
+    await load_todos()
+    notify_action('Edit canceled', color='blue')
+
+
+# Pages
+
+@ui.page('/')
+async def index():
+    """
+    Builds the page for a new client. A user who is still logged in on this
+    browser goes straight to their todo list.
+    """
+    ui.add_head_html('<link rel="stylesheet" href="/static/app.css">')
+    app.storage.client['main_container'] = ui.column()
+    show_login_screen()
+    if app.storage.user.get('id'):
+        await load_todos()
+
+
 # Main Execution
 if __name__ in {"__main__", "__mp_main__"}:
-    ui.page('/')
-    show_login_screen()
-    ui.run(port=8080)
+    ui.run(port=8080, storage_secret=STORAGE_SECRET)
@@ -1,6 +1,10 @@
 from datetime import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, request, abort
+from flask_compress import Compress
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import orjson
 import os
 
 app = Flask(__name__)
@@ -9,10 +13,34 @@ app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///data/todos.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Ensure the data folder exists for SQLite database. This runs at import time
+# because hypercorn imports the module instead of executing it as __main__.
+os.makedirs(os.path.join(app.root_path, 'data'), exist_ok=True)
+
+# Compress responses larger than 500 bytes, mostly todo lists, with Brotli or gzip
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_MIN_SIZE'] = 500
+Compress(app)
+
 # Initialize SQLAlchemy for ORM
 db = SQLAlchemy(app)
 
 
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Tunes every new SQLite connection for write throughput.
+    WAL journaling lets readers run alongside a writer, and synchronous=NORMAL
+    only syncs the WAL at checkpoints instead of on every commit.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA cache_size=-20000')  # Negative values are in KiB, so about 20 MB
+    cursor.close()
+
+
 # Database Model
 
 class Todo(db.Model):
@@ -23,22 +51,94 @@ class Todo(db.Model):
         description (str): The description of the todo item.
         user_id (int): The ID of the user associated with the todo.
         created_at (datetime): The timestamp when the todo was created.
+        created_at_str (str): The creation timestamp formatted for display.
     """
     id = db.Column(db.Integer, primary_key=True)
     description = db.Column(db.String(200), nullable=False)
-    user_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False, index=True)  # Indexed for per-user lookups
     created_at = db.Column(db.DateTime, default=datetime.utcnow)  # Timestamp of creation
+    created_at_str = db.Column(db.String(19))  # Formatted once at insert instead of on every read
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.created_at is None:
+            self.created_at = datetime.utcnow()
+        self.created_at_str = self.created_at.strftime('%Y-%m-%d %H:%M:%S')
+
+
+# Helper Functions
+
+def ojsonify(data):
+    """
+    Builds a JSON response using orjson, which is much faster than the stdlib
+    encoder behind jsonify.
+
+    Args:
+        data: The JSON-serializable data to return.
+
+    Returns:
+        Response: A Flask response with an application/json body.
+    """
+    return app.response_class(
+        orjson.dumps(data),
+        mimetype='application/json'
+    )
+
+
+def serialize_todo(todo):
+    """
+    Converts a todo item into its JSON representation.
+
+    Args:
+        todo (Todo): The todo item to serialize.
+
+    Returns:
+        dict: The todo's ID, description and formatted creation timestamp.
+    """
+    return {
+        'id': todo.id,
+        'description': todo.description,
+        'created_at': todo.created_at_str
+    }
+
+
+def update_description(todo_id, description):
+    """
+    Sets a todo's description with a single UPDATE statement, without loading the todo.
+
+    Args:
+        todo_id (int): The ID of the todo item to update.
+        description (str): The new description for the todo.
+
+    Returns:
+        bool: True if the todo exists and was updated, False otherwise.
+    """
+    result = db.session.execute(db.update(Todo).where(Todo.id == todo_id).values(description=description))
+    return result.rowcount > 0
 
 
 # Database Initialization
 
-@app.before_first_request
 def create_tables():
     """
-    Creates all database tables before the first request is handled.
-    This ensures the database schema is set up before interacting with the API.
+    Creates all database tables and migrates databases created by older versions.
+    Runs once per worker at startup, so request handling never has to check for it.
     """
-    db.create_all()
+    # BEGIN IMMEDIATE takes the write lock, so workers starting together set up the schema one at a time
+    db.session.execute(db.text('BEGIN IMMEDIATE'))
+    db.Model.metadata.create_all(bind=db.session.connection())
+
+    # create_all skips existing tables, so add what older versions did not create
+    db.session.execute(db.text('CREATE INDEX IF NOT EXISTS ix_todo_user_id ON todo (user_id)'))
+    columns = [row[1] for row in db.session.execute(db.text('PRAGMA table_info(todo)'))]
+    if 'created_at_str' not in columns:
+        db.session.execute(db.text('ALTER TABLE todo ADD COLUMN created_at_str VARCHAR(19)'))
+        db.session.execute(db.text("UPDATE todo SET created_at_str = strftime('%Y-%m-%d %H:%M:%S', created_at)"))
+    db.session.commit()
+
+
+with app.app_context():
+    create_tables()
 
 
 # API Endpoints
@@ -55,12 +155,15 @@ def get_todos():
         List of todo objects in JSON format.
     """
     user_id = request.args.get('user_id')
-    todos = Todo.query.filter_by(user_id=user_id).all()
-    return jsonify([{
-        'id': todo.id,
-        'description': todo.description,
-        'created_at': todo.created_at.strftime('%Y-%m-%d %H:%M:%S')
-    } for todo in todos])
+    # Select plain column tuples; building ORM objects just to read three fields is wasted work
+    rows = db.session.execute(
+        db.select(Todo.id, Todo.description, Todo.created_at_str).where(Todo.user_id == user_id)
+    ).all()
+    return ojsonify([{
+        'id': todo_id,
+        'description': description,
+        'created_at': created_at_str
+    } for todo_id, description, created_at_str in rows])
 
 
 @app.route('/todos', methods=['POST'])
@@ -79,11 +182,27 @@ def create_todo():
     new_todo = Todo(description=data['description'], user_id=data['user_id'])
     db.session.add(new_todo)
     db.session.commit()
-    return jsonify({
-        'id': new_todo.id,
-        'description': new_todo.description,
-        'created_at': new_todo.created_at.strftime('%Y-%m-%d %H:%M:%S')
-    }), 201
+    return ojsonify(serialize_todo(new_todo)), 201
+
+
+@app.route('/todos/bulk', methods=['POST'])
+def bulk_create_todos():
+    """
+    Creates several todo items with a single commit.
+
+    Request Body (JSON):
+        - todos (list): The todos to create, each with a description (str)
+          and the user_id (int) of the user creating it.
+
+    Returns:
+        A JSON list of the created todo objects along with HTTP 201 status.
+    """
+    data = request.json
+    now = datetime.utcnow()
+    new_todos = [Todo(description=t['description'], user_id=t['user_id'], created_at=now) for t in data['todos']]
+    db.session.bulk_save_objects(new_todos, return_defaults=True)  # return_defaults fills in the IDs
+    db.session.commit()
+    return ojsonify([serialize_todo(todo) for todo in new_todos]), 201
 
 
 @app.route('/todos/<int:todo_id>', methods=['PUT'])
@@ -98,17 +217,13 @@ def update_todo(todo_id):
         - description (str): The new description for the todo.
     
     Returns:
-        The updated todo object in JSON format.
+        The updated todo's ID and description in JSON format.
     """
     data = request.json
-    todo = Todo.query.get_or_404(todo_id)
-    todo.description = data['description']
+    if not update_description(todo_id, data['description']):
+        abort(404)
     db.session.commit()
-    return jsonify({
-        'id': todo.id,
-        'description': todo.description,
-        'created_at': todo.created_at.strftime('%Y-%m-%d %H:%M:%S')
-    })
+    return ojsonify({'id': todo_id, 'description': data['description']})
 
 
 @app.route('/todos/<int:todo_id>', methods=['DELETE'])
@@ -122,18 +237,61 @@ def delete_todo(todo_id):
     Returns:
         An empty response with HTTP 200 status upon successful deletion.
     """
-    todo = Todo.query.get_or_404(todo_id)
+    todo = db.session.get(Todo, todo_id)
+    if todo is None:
+        abort(404)
     db.session.delete(todo)
     db.session.commit()
     return '', 200
 
 
+@app.route('/todos/batch', methods=['POST'])
+def batch_todos():
+    """
+    Applies several todo operations in order and commits them in a single transaction.
+
+    Request Body (JSON):
+        - ops (list): The operations to apply. Each one is either
+            {"op": "add", "description": str, "user_id": int},
+            {"op": "edit", "id": int, "description": str} or
+            {"op": "delete", "id": int}.
+
+    Returns:
+        A JSON list with one result per operation, holding the HTTP status the
+        single-todo endpoint would have returned and, for add and edit, the todo
+        fields the endpoint would have returned.
+    """
+    data = request.json
+    results = []
+    for op in data['ops']:
+        if op['op'] == 'add':
+            todo = Todo(description=op['description'], user_id=op['user_id'])
+            db.session.add(todo)
+            db.session.flush()  # Assigns the ID without committing
+            results.append({'status': 201, 'todo': serialize_todo(todo)})
+        elif op['op'] == 'edit':
+            if update_description(op['id'], op['description']):
+                results.append({'status': 200, 'todo': {'id': op['id'], 'description': op['description']}})
+            else:
+                results.append({'status': 404})
+        elif op['op'] == 'delete':
+            todo = db.session.get(Todo, op['id'])
+            if todo is None:
+                results.append({'status': 404})
+            else:
+                db.session.delete(todo)
+                results.append({'status': 200})
+        else:
+            results.append({'status': 400})
+    db.session.commit()
+    return ojsonify(results)
+
+
 # Application Entry Point
 
 if __name__ == '__main__':
     """
-    The main entry point of the application. Ensures that the 'data' directory 
-    exists and starts the Flask application.
+    The main entry point of the application for local debugging. In the container
+    the app is served by hypercorn instead, see the dockerfile.
     """
-    os.makedirs('data', exist_ok=True)
     app.run(host='0.0.0.0', port=5002)
@@ -1,17 +1,61 @@
 from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from functools import lru_cache
+import hashlib
+import hmac
+import httpx
 import os
 
 app = Flask(__name__)
 
+# Todo service endpoint, used to return a user's todos together with the login
+API_URL_TODO = "http://todo-service:5002"
+
 # Configure SQLite database path for user management
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///data/users.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Ensure the data folder exists for SQLite database. This runs at import time
+# because hypercorn imports the module instead of executing it as __main__.
+os.makedirs(os.path.join(app.root_path, 'data'), exist_ok=True)
+
+# Secret key for password hashing (at most 64 bytes, the BLAKE2b key limit). It has no
+# default, since a key kept in this source file would let anyone recompute the stored hashes.
+PASSWORD_HASH_KEY = os.environ.get('PASSWORD_HASH_KEY', '').encode()
+if not PASSWORD_HASH_KEY:
+    raise RuntimeError('PASSWORD_HASH_KEY must be set to a secret key for password hashing')
+if len(PASSWORD_HASH_KEY) > hashlib.blake2b.MAX_KEY_SIZE:
+    raise RuntimeError(f'PASSWORD_HASH_KEY must be at most {hashlib.blake2b.MAX_KEY_SIZE} bytes long')
+
 # Initialize SQLAlchemy for ORM
 db = SQLAlchemy(app)
 
 
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Tunes every new SQLite connection for write throughput.
+    WAL journaling lets readers run alongside a writer, and synchronous=NORMAL
+    only syncs the WAL at checkpoints instead of on every commit.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA cache_size=-20000')  # Negative values are in KiB, so about 20 MB
+    cursor.close()
+
+
+# Pooled HTTP/2 session for calls to the todo service, so concurrent logins share one open
+# connection. The todo service speaks HTTP/2 without TLS, hence http1=False. The timeout
+# stays well under the frontend's 5 s default, so a login can still answer with null
+# todos before the frontend gives up on it.
+session_todo = httpx.Client(transport=httpx.HTTPTransport(http1=False, http2=True, retries=2), timeout=2.0)
+
+
 # Database Model
 
 class User(db.Model):
@@ -21,22 +65,102 @@ class User(db.Model):
     Attributes:
         id (int): The primary key of the user.
         username (str): The username of the user, must be unique.
-        password (str): The password of the user.
+        password_hash (str): The keyed hash of the user's password.
     """
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    password = db.Column(db.String(120), nullable=False)
+    username = db.Column(db.String(80), unique=True, nullable=False, index=True)
+    password_hash = db.Column(db.String(64), nullable=False)
+
+
+# Helper Functions
+
+def hash_password(password):
+    """
+    Hashes a password with keyed BLAKE2b.
+
+    Args:
+        password (str): The plaintext password.
+
+    Returns:
+        str: The 64 character hex digest to store or compare against.
+    """
+    return hashlib.blake2b(password.encode(), key=PASSWORD_HASH_KEY, digest_size=32).hexdigest()
+
+
+@lru_cache(maxsize=4096)
+def _lookup_user(username):
+    """
+    Looks up a user's ID and password hash, caching the result in this process
+    so repeated logins do not query the database.
+
+    Users are never changed or deleted once created, so cached entries never go
+    stale. Unknown usernames raise instead of returning, because lru_cache does
+    not cache exceptions: a user created later, possibly by another worker, is
+    found on the next lookup without having to clear the cache.
+
+    Args:
+        username (str): The user's username.
+
+    Returns:
+        tuple: The user's ID and password hash.
+
+    Raises:
+        LookupError: If no user has the given username.
+    """
+    row = db.session.execute(db.select(User.id, User.password_hash).where(User.username == username)).first()
+    if row is None:
+        raise LookupError(username)
+    return tuple(row)
+
+
+def authenticate(username, password):
+    """
+    Looks a user up by username and verifies the password hash in constant time.
+
+    Args:
+        username (str): The user's username.
+        password (str): The user's plaintext password.
+
+    Returns:
+        int: The authenticated user's ID, or None if the credentials are incorrect.
+    """
+    try:
+        user_id, password_hash = _lookup_user(username)
+    except LookupError:
+        return None
+    if hmac.compare_digest(password_hash, hash_password(password)):
+        return user_id
+    return None
 
 
 # Database Initialization
 
-@app.before_first_request
 def create_tables():
     """
-    Creates the database tables before handling the first request.
-    Ensures the database schema is created and ready for use.
+    Creates the database tables and migrates databases created by older versions.
+    Runs once per worker at startup, so request handling never has to check for it.
     """
-    db.create_all()
+    # BEGIN IMMEDIATE takes the write lock, so workers starting together set up the schema one at a time
+    db.session.execute(db.text('BEGIN IMMEDIATE'))
+
+    # Databases created before passwords were hashed still have a plaintext password column.
+    # The table is rebuilt rather than altered, so it gets the same NOT NULL column and
+    # username index as a freshly created one.
+    columns = [row[1] for row in db.session.execute(db.text('PRAGMA table_info(user)'))]
+    if 'password' in columns:
+        db.session.execute(db.text('ALTER TABLE user RENAME TO user_legacy'))
+    db.Model.metadata.create_all(bind=db.session.connection())
+    if 'password' in columns:
+        legacy_users = db.session.execute(db.text('SELECT id, username, password FROM user_legacy')).all()
+        for user_id, username, password in legacy_users:
+            db.session.execute(db.insert(User).values(id=user_id, username=username,
+                                                      password_hash=hash_password(password)))
+        db.session.execute(db.text('DROP TABLE user_legacy'))
+    db.session.commit()
+
+
+with app.app_context():
+    create_tables()
 
 
 # API Endpoints
@@ -55,14 +179,14 @@ def create_user():
         if the username already exists.
     """
     data = request.json
-    # Check if the user already exists
-    if User.query.filter_by(username=data['username']).first():
-        return jsonify({'error': 'User already exists'}), 409
-    
-    # Create and save the new user
-    new_user = User(username=data['username'], password=data['password'])
+    # Create and save the new user; the unique username index rejects duplicates
+    new_user = User(username=data['username'], password_hash=hash_password(data['password']))
     db.session.add(new_user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'User already exists'}), 409
     
     # Return the created user with status 201
     return jsonify({'id': new_user.id, 'username': new_user.username}), 201
@@ -83,22 +207,51 @@ def login():
     """
     data = request.json
     # Attempt to find the user with matching credentials
-    user = User.query.filter_by(username=data['username'], password=data['password']).first()
-    if user:
-        return jsonify({'id': user.id, 'username': user.username}), 200
+    user_id = authenticate(data['username'], data['password'])
+    if user_id:
+        return jsonify({'id': user_id, 'username': data['username']}), 200
     else:
         return '', 401
 
 
+@app.route('/login_with_todos', methods=['POST'])
+def login_with_todos():
+    """
+    Authenticates a user and returns their todos in the same response, saving the
+    client a second round trip to the todo service.
+
+    Request Body (JSON):
+        - username (str): The user's username.
+        - password (str): The user's password.
+
+    Returns:
+        JSON object with the user's ID and username under 'user' and their todos
+        under 'todos', or HTTP 401 status if the credentials are incorrect. If the
+        todo service could not be reached the login still succeeds, with 'todos'
+        set to null so the client can load them itself.
+    """
+    data = request.json
+    user_id = authenticate(data['username'], data['password'])
+    if not user_id:
+        return '', 401
+
+    try:
+        response = session_todo.get(f"{API_URL_TODO}/todos", params={"user_id": user_id})
+        todos = response.json() if response.status_code == 200 else None
+    except httpx.HTTPError:
+        todos = None
+    return jsonify({
+        'user': {'id': user_id, 'username': data['username']},
+        'todos': todos
+    }), 200
+
+
 # Application Entry Point
 
 if __name__ == '__main__':
     """
-    The main entry point of the application. Ensures that the 'data' directory
-    exists and starts the Flask application.
+    The main entry point of the application for local debugging. In the container
+    the app is served by hypercorn instead, see the dockerfile.
     """
-    # Ensure the data folder exists for SQLite database
-    os.makedirs('data', exist_ok=True)
-    
     # Start the Flask app on port 5001, accessible on all network interfaces
     app.run(host='0.0.0.0', port=5001)